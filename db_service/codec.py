@@ -0,0 +1,66 @@
+"""Раскладка записи шард-файла и её (де)сериализация.
+
+Модуль самодостаточный и полностью аннотирован, поэтому его можно собрать
+mypyc (`mypyc codec.py`) — собранное расширение подхватится тем же import'ом.
+"""
+from typing import Dict, List, Optional
+
+FIELD_SEPARATOR = b'|'
+FIELDS = ['id', 'username', 'password_hash', 'ip_reg', 'last_logged', 'last_ip']
+MAX_LENGTHS = {
+    'id': 10,
+    'username': 24,
+    'password_hash': 64,
+    'ip_reg': 16,
+    'last_logged': 19,
+    'last_ip': 16,
+}
+RECORD_SIZE = sum(MAX_LENGTHS[f] for f in FIELDS) + (len(FIELDS) - 1)
+
+# заранее считаем смещения полей внутри записи
+FIELD_OFFSETS: Dict[str, int] = {}
+_off = 0
+for i, f in enumerate(FIELDS):
+    FIELD_OFFSETS[f] = _off
+    _off += MAX_LENGTHS[f] + (1 if i < len(FIELDS) - 1 else 0)
+
+# позиция поля в кортеже значений (Record.values хранится в порядке FIELDS)
+FIELD_INDEX: Dict[str, int] = {f: i for i, f in enumerate(FIELDS)}
+
+# срез каждого поля внутри записи — разбор без поиска разделителей
+FIELD_SLICES: Dict[str, slice] = {
+    f: slice(FIELD_OFFSETS[f], FIELD_OFFSETS[f] + MAX_LENGTHS[f]) for f in FIELDS
+}
+
+_WIDTHS: List[int] = [MAX_LENGTHS[f] for f in FIELDS]
+
+
+def fit_field(value: str, width: int) -> str:
+    """Обрезает значение до width байт UTF-8 по границе символа —
+    многобайтовый символ не режется пополам."""
+    return value.encode()[:width].decode('utf-8', 'ignore')
+
+
+def encode_record(values: List[str]) -> List[bytes]:
+    """Готовит запись (значения в порядке FIELDS) как список буферов для os.pwritev.
+
+    Значения уже должны влезать в ширину поля (см. fit_field) — здесь они только
+    дополняются пробелами; между полями — общий FIELD_SEPARATOR, склейка в один
+    блоб не нужна, буферы собирает ядро.
+    """
+    iov: List[bytes] = []
+    for i in range(len(_WIDTHS)):
+        if i:
+            iov.append(FIELD_SEPARATOR)
+        iov.append(values[i].encode().ljust(_WIDTHS[i]))
+    return iov
+
+
+def decode_record(raw: bytes, fields: Optional[List[str]] = None) -> List[str]:
+    """Достаёт из блоба записи значения fields (по умолчанию все, в порядке FIELDS).
+
+    Поля режутся по фиксированным смещениям, декодируются только запрошенные.
+    'ignore' — для записей, где старая версия разрезала многобайтовый символ.
+    """
+    return [raw[FIELD_SLICES[f]].rstrip(b' ').decode('utf-8', 'ignore')
+            for f in (fields or FIELDS)]
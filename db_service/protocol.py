@@ -0,0 +1,94 @@
+"""Протокол UNIX-сокета между прокси и шард-сервером.
+
+Каждое сообщение — кадр: 4 байта длины (big-endian) и msgpack-тело.
+Запрос — одна из структур ниже, команда передаётся тегом; структуры
+кодируются массивами ([тег, аргументы по порядку]), так что ни имён полей
+на проводе, ни их сопоставления при декодировании. Ответ — Reply.
+
+Запросы одного соединения можно слать пачкой, не дожидаясь ответов. Сервер
+выполняет их по порядку, кроме FIND: тот стартует после всех предыдущих
+запросов, но идёт параллельно со следующими и может увидеть их изменения.
+Ответы всегда приходят в порядке запросов.
+"""
+import asyncio
+import struct
+import msgspec
+from typing import Any, Dict, List, Literal, Optional, Union
+
+HEADER = struct.Struct('>I')
+# верхняя граница длины кадра: битый или чужой заголовок не должен
+# заставить readexactly() копить в памяти гигабайты
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+class CreateReq(msgspec.Struct, tag='CREATE', array_like=True):
+    username: str
+    password_hash: str
+    ip_reg: str
+    last_logged: str
+    last_ip: str
+
+
+class GetReq(msgspec.Struct, tag='GET', array_like=True):
+    ref: str
+    fields: Optional[List[str]] = None
+
+
+class DeleteReq(msgspec.Struct, tag='DELETE', array_like=True):
+    ref: str
+
+
+# поля, которые можно менять (id — нельзя); чужой ключ msgspec отвергнет
+# ещё при декодировании, с ValidationError
+UpdatableField = Literal['username', 'password_hash', 'ip_reg', 'last_logged', 'last_ip']
+
+
+class UpdateReq(msgspec.Struct, tag='UPDATE', array_like=True):
+    ref: str
+    fields: Dict[UpdatableField, str]
+
+
+class FindReq(msgspec.Struct, tag='FIND', array_like=True):
+    field: str
+    value: str
+    fields: Optional[List[str]] = None
+
+
+Request = Union[CreateReq, GetReq, DeleteReq, UpdateReq, FindReq]
+
+
+class Reply(msgspec.Struct, omit_defaults=True, array_like=True):
+    ok: bool
+    result: Any = None          # ref / запись / список записей / статус
+    error: Optional[str] = None
+
+
+def frame(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameTooLarge(ValueError):
+    """Заявленная длина кадра больше допустимой; тело кадра ещё не прочитано."""
+
+    def __init__(self, size: int):
+        super().__init__(f"Frame too large: {size} bytes")
+        self.size = size
+
+
+async def read_frame(reader: asyncio.StreamReader,
+                     max_size: int = MAX_FRAME_SIZE) -> bytes:
+    """Читает один кадр; IncompleteReadError — соединение закрыто,
+    FrameTooLarge — заявленная длина больше max_size (тело можно пропустить skip_frame)."""
+    header = await reader.readexactly(HEADER.size)
+    (size,) = HEADER.unpack(header)
+    if size > max_size:
+        raise FrameTooLarge(size)
+    return await reader.readexactly(size)
+
+
+async def skip_frame(reader: asyncio.StreamReader, size: int, chunk: int = 64 * 1024):
+    """Пропускает тело отвергнутого кадра кусками, не держа его целиком в памяти."""
+    while size:
+        n = min(size, chunk)
+        await reader.readexactly(n)
+        size -= n
@@ -1,6 +1,6 @@
-from typing import NamedTuple, Dict
+from typing import NamedTuple, Tuple
 
 
 class Record(NamedTuple):
-    fields: Dict[str, str]
+    values: Tuple[str, ...]  # значения полей в порядке codec.FIELDS
     timestamp: int
@@ -1,75 +1,218 @@
 import asyncio
 import os
+import signal
+import sys
 import logging
-import json
-
+import msgspec
+import uvloop
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Union
+from protocol import (HEADER, CreateReq, GetReq, DeleteReq, UpdateReq, FindReq, Request,
+                      Reply, FrameTooLarge, frame, read_frame, skip_frame)
 from shard import ShardManager
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
 
 SOCKET_PATH = os.getenv("USER_DB_PATH", "/tmp/user_db.sock")
+# USER_DB_LOOP=rloop — опционально попробовать rloop (только Linux), иначе uvloop
+EVENT_LOOP = os.getenv("USER_DB_LOOP", "uvloop")
+DRAIN_THRESHOLD = 64 * 1024  # bytes
+LISTEN_BACKLOG = 4096  # по умолчанию 100 — при шторме подключений воркеров connect() отваливается
+MAX_REQUEST_SIZE = 64 * 1024  # самый большой запрос — CREATE/UPDATE, это сотни байт
+MAX_PIPELINE = 256  # неотправленных ответов одного соединения
+
+# кодек один на процесс: Decoder заранее знает схему запросов,
+# Encoder переиспользует внутренний буфер
+DECODER = msgspec.msgpack.Decoder(Request)
+ENCODER = msgspec.msgpack.Encoder()
+
+# неизменные ответы кодируем один раз — сразу готовыми кадрами
+NOT_FOUND     = frame(ENCODER.encode(Reply(ok=False, error="Not found")))
+DELETED       = frame(ENCODER.encode(Reply(ok=True, result="Deleted")))
+DELETE_FAILED = frame(ENCODER.encode(Reply(ok=False, error="Delete failed")))
+UPDATED       = frame(ENCODER.encode(Reply(ok=True, result="Updated")))
+UPDATE_FAILED = frame(ENCODER.encode(Reply(ok=False, error="Update failed")))
+TOO_LARGE     = frame(ENCODER.encode(Reply(ok=False, error="Request too large")))
+
+
+def _next_reply_ready(replies: deque) -> bool:
+    # в очереди готовые ответы, задачи FIND и None — конец потока запросов
+    if not replies:
+        return False
+    head = replies[0]
+    return not isinstance(head, asyncio.Task) or head.done()
+
+
+# ────────── обработчики команд: по одному на тип запроса
+# возвращают Reply либо уже готовый кадр (bytes) из констант выше
+async def _create(req: CreateReq, manager: ShardManager) -> Reply:
+    ref = await manager.add_record(req.username, req.password_hash,
+                                   req.ip_reg, req.last_logged, req.last_ip)
+    return Reply(ok=True, result=ref)
+
+
+async def _get(req: GetReq, manager: ShardManager) -> Union[Reply, bytes]:
+    rec = await manager.get_record(req.ref, req.fields)
+    if rec is None:
+        return NOT_FOUND
+    return Reply(ok=True, result=rec)
+
+
+async def _delete(req: DeleteReq, manager: ShardManager) -> bytes:
+    ok = await manager.delete_record(req.ref)
+    return DELETED if ok else DELETE_FAILED
+
+
+async def _update(req: UpdateReq, manager: ShardManager) -> bytes:
+    ok = await manager.update_record(req.ref, req.fields)
+    return UPDATED if ok else UPDATE_FAILED
+
+
+async def _find(req: FindReq, manager: ShardManager) -> Reply:
+    recs = await manager.find_records(req.field, req.value, req.fields)
+    return Reply(ok=True, result=recs)
+
+
+HANDLERS: Dict[type, Callable[[Any, ShardManager], Awaitable[Union[Reply, bytes]]]] = {
+    CreateReq: _create,
+    GetReq   : _get,
+    DeleteReq: _delete,
+    UpdateReq: _update,
+    FindReq  : _find,
+}
+
+
+def _decode(payload: bytes) -> Union[Request, Reply]:
+    """Запрос либо готовый Reply с ошибкой разбора."""
+    try:
+        return DECODER.decode(payload)
+    except msgspec.ValidationError as e:
+        return Reply(ok=False, error=f"Bad request: {e}")
+    except Exception as e:
+        return Reply(ok=False, error=str(e))
+
+
+async def _dispatch(req: Request, manager: ShardManager) -> Union[Reply, bytes]:
+    try:
+        return await HANDLERS[type(req)](req, manager)
+    except Exception as e:
+        return Reply(ok=False, error=str(e))
+
+
+async def _read_requests(reader: asyncio.StreamReader, replies: deque,
+                         slots: asyncio.Semaphore, ready: asyncio.Event,
+                         manager: ShardManager, addr):
+    """Читает кадры и выполняет запросы строго по очереди. Исключение — FIND:
+    он стартует после всех предыдущих, но идёт задачей параллельно следующим,
+    чтобы медленный скан не держал стоящие за ним GET."""
+    while True:
+        try:
+            payload = await read_frame(reader, MAX_REQUEST_SIZE)
+        except asyncio.IncompleteReadError:
+            break
+        except FrameTooLarge as e:
+            # заголовок честный — пропускаем тело и отвечаем ошибкой,
+            # остальные запросы этого соединения не страдают
+            logger.warning("%s from %s", e, addr)
+            await skip_frame(reader, e.size)
+            payload = None
+
+        # неотправленных ответов не больше MAX_PIPELINE — иначе перестаём читать
+        await slots.acquire()
+        if payload is None:
+            item = TOO_LARGE
+        else:
+            req = _decode(payload)
+            if req.__class__ is Reply:
+                item = req
+            elif req.__class__ is FindReq:
+                item = asyncio.create_task(_dispatch(req, manager))
+            else:
+                # shield: обрыв соединения не должен прервать начатую запись
+                item = await asyncio.shield(_dispatch(req, manager))
+        replies.append(item)
+        ready.set()
+    replies.append(None)  # конец потока запросов
+    ready.set()
+
+
+async def _write_replies(writer: asyncio.StreamWriter, replies: deque,
+                         slots: asyncio.Semaphore, ready: asyncio.Event):
+    """Отдаёт ответы строго в порядке запросов — на этом держится FIFO прокси."""
+    out = bytearray()  # ответы пачки: кадр за кадром, заголовок + тело
+    while True:
+        while not replies:
+            ready.clear()
+            await ready.wait()
+        item = replies.popleft()
+        if item is None:
+            break
+        # shield: отмена отправителя (клиент ушёл) не должна обрывать начатый FIND
+        reply = await asyncio.shield(item) if isinstance(item, asyncio.Task) else item
+        slots.release()
+
+        if reply.__class__ is bytes:
+            out += reply  # готовый кадр
+        else:
+            # тело кодируем сразу в общий буфер, место под заголовок оставляем перед ним
+            start = len(out)
+            ENCODER.encode_into(reply, out, start + HEADER.size)
+            HEADER.pack_into(out, start, len(out) - start - HEADER.size)
+
+        # пока следующий ответ уже готов, копим и отдаём пачку одним write()
+        if len(out) >= DRAIN_THRESHOLD or not _next_reply_ready(replies):
+            writer.write(out)
+            # при high=0 drain() возвращается только с пустым буфером транспорта,
+            # поэтому после него out можно переиспользовать
+            await writer.drain()
+            out.clear()
+    if out:
+        writer.write(out)
+        await writer.drain()
 
 
 async def handle_client(reader: asyncio.StreamReader,
                         writer: asyncio.StreamWriter,
                         manager: ShardManager):
     addr = writer.get_extra_info('peername')
-    logging.info(f"Client connected: {addr}")
-
+    logger.debug("Client connected: %s", addr)
+    # drain() ждёт, пока ответ целиком не уйдёт в сокет, — честный backpressure
+    writer.transport.set_write_buffer_limits(high=0)
+
+    replies: deque = deque()  # ответы (или задачи FIND) в порядке запросов
+    slots = asyncio.Semaphore(MAX_PIPELINE)
+    ready = asyncio.Event()   # в replies что-то появилось
+    tasks = [asyncio.create_task(_read_requests(reader, replies, slots, ready, manager, addr)),
+             asyncio.create_task(_write_replies(writer, replies, slots, ready))]
     try:
-        while not reader.at_eof():
-            data = await reader.readline()
-            if not data:
-                break
-            req = data.decode().strip()
-
-            try:
-                if req.startswith("CREATE "):
-                    _, u, ph, ip1, t, ip2 = req.split(" ", 5)
-                    ref = await manager.add_record(u, ph, ip1, t, ip2)
-                    writer.write(f"OK {ref}\n".encode())
-
-                elif req.startswith("GET "):
-                    parts = req.split(" ", 2)
-                    ref = parts[1]
-                    fields = parts[2].split(',') if len(parts) == 3 else None
-                    rec = await manager.get_record(ref, fields)
-                    if rec is None:
-                        writer.write(f"ERROR Not found\n".encode())
-                    else:
-                        writer.write(f"OK {json.dumps(rec)}\n".encode())
-
-                elif req.startswith("DELETE "):
-                    ref = req.split(" ", 1)[1]
-                    ok = await manager.delete_record(ref)
-                    writer.write(("OK Deleted\n" if ok else f"ERROR Delete failed\n").encode())
-
-                elif req.startswith("UPDATE "):
-                    parts = req.split(" ", 2)
-                    ref = parts[1]
-                    upd = dict(pair.split("=", 1) for pair in parts[2].split())
-                    ok = await manager.update_record(ref, upd)
-                    writer.write(("OK Updated\n" if ok else f"ERROR Update failed\n").encode())
-
-                elif req.startswith("FIND "):
-                    parts = req.split(" ", 3)
-                    field, value = parts[1], parts[2]
-                    fields = parts[3].split(',') if len(parts) == 4 else None
-                    recs = await manager.find_records(field, value, fields)
-                    writer.write(f"OK {json.dumps(recs)}\n".encode())
-
-                else:
-                    writer.write(b"ERROR UNKNOWN COMMAND\n")
-
-            except Exception as e:
-                writer.write(f"ERROR {e}\n".encode())
-
-            await writer.drain()
+        # читатель завершается сам на EOF и пропускает отправителя дописать хвост;
+        # ошибка любого из них (обрыв соединения) гасит обоих
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for t in done:
+            e = t.exception()
+            if isinstance(e, ConnectionResetError):
+                logger.debug("Connection reset: %s", addr)
+            elif e is not None:
+                logger.error("Connection %s failed: %r", addr, e)
     finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # клиент уже ушёл или соединение бросаем — ждать FIN (wait_closed) незачем
         writer.close()
-        await writer.wait_closed()
-        logging.info(f"Connection closed: {addr}")
+        logger.debug("Connection closed: %s", addr)
+
+
+def _loop_policy() -> asyncio.AbstractEventLoopPolicy:
+    if EVENT_LOOP == "rloop" and sys.platform == "linux":
+        try:
+            import rloop
+            return rloop.EventLoopPolicy()
+        except ImportError:
+            logger.warning("rloop is not installed, falling back to uvloop")
+    return uvloop.EventLoopPolicy()
 
 
 async def start_server():
@@ -79,18 +222,32 @@ async def start_server():
     mgr = ShardManager(base_path='shards')
     server = await asyncio.start_unix_server(
         lambda r, w: handle_client(r, w, mgr),
-        path=SOCKET_PATH
+        path=SOCKET_PATH,
+        backlog=LISTEN_BACKLOG
     )
-    logging.info(f"Server listening on {SOCKET_PATH}")
-    async with server:
-        await server.serve_forever()
+    logger.info("Server listening on %s", SOCKET_PATH)
+
+    # под docker сервер — PID 1 и получает SIGTERM: без обработчика процесс
+    # умирает, не сбросив отложенные .info/.log
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        logger.info("Shutting down.")
+    finally:
+        # не serve_forever/wait_closed: они ждали бы закрытия постоянного соединения прокси
+        server.close()
+        await mgr.close()
 
 
 if __name__ == "__main__":
+    asyncio.set_event_loop_policy(_loop_policy())
     try:
         asyncio.run(start_server())
-    except KeyboardInterrupt:
-        logging.info("Shutting down.")
+    except KeyboardInterrupt:  # Ctrl+C до установки обработчиков сигналов
+        logger.info("Shutting down.")
     finally:
         if os.path.exists(SOCKET_PATH):
             os.remove(SOCKET_PATH)
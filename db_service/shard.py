@@ -1,41 +1,92 @@
 import asyncio
 import aiofiles
+import concurrent.futures
 import mmap
 import os
+import threading
 import time
-import json
 import logging
+import numpy as np
+import orjson
+from collections import Counter, OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
+from codec import (FIELDS, MAX_LENGTHS, RECORD_SIZE, FIELD_OFFSETS,
+                   FIELD_INDEX, encode_record, decode_record, fit_field)
 from record import Record
 
 # Settings
 RECORD_LIMIT = 5000
-FIELD_SEPARATOR = b'|'
-FIELDS = ['id', 'username', 'password_hash', 'ip_reg', 'last_logged', 'last_ip']
-MAX_LENGTHS = {
-    'id': 10,
-    'username': 24,
-    'password_hash': 64,
-    'ip_reg': 16,
-    'last_logged': 19,
-    'last_ip': 16,
-}
 LOG_LIMIT = 1000
-RECORD_SIZE = sum(MAX_LENGTHS[f] for f in FIELDS) + (len(FIELDS) - 1)
 TTL_SECONDS = 5 * 3600  # 5 hours
+CACHE_LIMIT = 10_000
+FD_CACHE_LIMIT = 128
 IO_TIMEOUT = 5.0
+INFO_FLUSH_INTERVAL = 0.5  # seconds
+
+# символы, которые вырезаются из значений полей (перевод строки ломает протокол, '|' — разделитель)
+_CLEAN_TABLE = str.maketrans('', '', '\n|')
+
+# раскладка записи из codec для numpy: структурный dtype поверх mmap шард-файла
+RECORD_DTYPE = np.dtype({
+    'names'   : FIELDS,
+    'formats' : [f'S{MAX_LENGTHS[f]}' for f in FIELDS],
+    'offsets' : [FIELD_OFFSETS[f] for f in FIELDS],
+    'itemsize': RECORD_SIZE,
+})
+
+
+def _pwrite_chunks(fd: int, chunks: List[tuple]):
+    """Пишет набор (offset, data) в fd за один заход в поток."""
+    for offset, data in chunks:
+        os.pwrite(fd, data, offset)
+
+
+def _count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def _append_log_sync(path: Path, lines: List[bytes], count: Optional[int]) -> int:
+    """Дописывает строки в журнал, при переполнении оставляет последние LOG_LIMIT.
+
+    Возвращает число строк в журнале после записи.
+    """
+    if count is None:
+        count = _count_lines(path)
+    with open(path, 'ab') as f:
+        f.write(b''.join(lines))
+    count += len(lines)
+    if count > 2 * LOG_LIMIT:
+        with open(path, 'rb') as f:
+            tail = f.readlines()[-LOG_LIMIT:]
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(tail))
+        os.replace(tmp, path)
+        count = len(tail)
+    return count
+
+
+def _free_slots_sync(path: Path, free: List[int], next_id: int) -> List[int]:
+    """Оставляет в списке свободных только реально пустые слоты: за next_id
+    и занятые (первый байт не нулевой) выкидываются."""
+    if not path.exists():
+        return []
+    kept = []
+    with open(path, 'rb') as f:
+        fd = f.fileno()
+        for rec_id in dict.fromkeys(free):
+            if 0 <= rec_id < next_id and os.pread(fd, 1, rec_id * RECORD_SIZE) == b'\x00':
+                kept.append(rec_id)
+    return kept
 
-# заранее считаем смещения полей внутри записи
-FIELD_OFFSETS: Dict[str, int] = {}
-_off = 0
-for i, f in enumerate(FIELDS):
-    FIELD_OFFSETS[f] = _off
-    _off += MAX_LENGTHS[f] + (1 if i < len(FIELDS) - 1 else 0)
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
 
 class ShardManager:
     def __init__(self, base_path: str = 'shards'):
@@ -46,30 +97,116 @@ class ShardManager:
             
         self.meta_lock = asyncio.Lock()
         self.data_lock = asyncio.Lock()
-        self.cache_lock = asyncio.Lock()
         
-        # cache: ref -> Record
-        self.cache: Dict[str, Record] = {}
+        # cache: ref -> Record, LRU-порядок (последние использованные в конце).
+        # Трогаем только из event loop и без await внутри — отдельный lock не нужен.
+        self.cache: OrderedDict[str, Record] = OrderedDict()
+
+        # отдельный пул под mmap-сканирование, чтобы не делить дефолтный с файловым I/O
+        self._scan_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=os.cpu_count(), thread_name_prefix='shard-scan')
+        # path -> mmap шард-файла; сканы идут из потоков пула, поэтому RLock
+        self._mmaps: Dict[Path, mmap.mmap] = {}
+        self._mmap_lock = threading.RLock()
+        # path -> номер поколения: _drop_mmap его двигает, чтобы скан, начавший
+        # отображать файл до роста, не опубликовал устаревшее отображение
+        self._mmap_gen: Counter = Counter()
+
+        # path -> открытый fd шард-файла (LRU); I/O через pread/pwrite без seek.
+        # _fd_busy считает операции в потоках, такие fd при вытеснении не закрываем
+        self._fds: OrderedDict[Path, int] = OrderedDict()
+        self._fd_busy: Counter = Counter()
+
+        # prefix -> info; изменения копятся в памяти и сбрасываются на диск пачкой
+        self._info_cache: Dict[str, Dict] = {}
+        # prefix -> ещё не записанные строки журнала операций и число строк в .log
+        self._log_buf: Dict[str, List[bytes]] = {}
+        self._log_count: Dict[str, int] = {}
+        self._dirty: set[str] = set()
+        self._flusher_task: Optional[asyncio.Task] = None
 
     @staticmethod
+    @lru_cache(maxsize=8192)
     def _sanitize_shard_prefix(username: str) -> str:
-        return username[0].lower() if username and username[0].isalpha() else 'q'
+        # ровно один символ: 'İ'.lower() == 'i̇' — два символа, берём первый
+        return username[0].lower()[0] if username and username[0].isalpha() else 'q'
 
     @staticmethod
     def _clean_field(value: str) -> str:
-        return value.replace('\n', '').replace('|', '')
+        return value.translate(_CLEAN_TABLE)
 
     @staticmethod
-    def _validate_ref(ref: str) -> (str, int):
+    @lru_cache(maxsize=8192)
+    def _validate_ref(ref: str) -> Tuple[str, int, int]:
+        """Разбирает ref вида 'a12:34' в (prefix, shard_idx, rec_id)."""
         try:
             shard, rec_id = ref.split(':')
-            return shard, int(rec_id)
+            prefix = shard.rstrip('0123456789')
+            # префикс — только то, что мог выдать _sanitize_shard_prefix (он сам себе
+            # неподвижная точка); иначе ref вроде '../x0:0' уводит запись/удаление
+            # за пределы base_path
+            if prefix != ShardManager._sanitize_shard_prefix(prefix):
+                raise ValueError(ref)
+            digits = shard[len(prefix):]
+            idx, rec_id_num = int(digits), int(rec_id)
+            # только каноническая запись чисел: 'a0:00', 'a0:+0', 'a0: 0' указывают
+            # на тот же слот, но кэш ключуется строкой ref — псевдонимы его обходят
+            if str(idx) != digits or str(rec_id_num) != rec_id or rec_id_num < 0:
+                raise ValueError(ref)
+            return prefix, idx, rec_id_num
         except ValueError:
             raise ValueError(f"Invalid reference format: {ref}")
 
+    def _cache_get(self, ref: str) -> Optional[Record]:
+        rec = self.cache.get(ref)
+        if rec is None:
+            return None
+        if time.time() - rec.timestamp > TTL_SECONDS:
+            del self.cache[ref]
+            return None
+        self.cache.move_to_end(ref)
+        return rec
+
+    def _cache_put(self, ref: str, rec: Record):
+        self.cache[ref] = rec
+        self.cache.move_to_end(ref)
+        while len(self.cache) > CACHE_LIMIT:
+            self.cache.popitem(last=False)
+
+    def _get_fd(self, path: Path, create: bool = False) -> int:
+        fd = self._fds.get(path)
+        if fd is None:
+            fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+            self._fds[path] = fd
+        self._fds.move_to_end(path)
+        return fd
+
+    def _evict_fds(self):
+        for path, fd in list(self._fds.items()):
+            if len(self._fds) <= FD_CACHE_LIMIT:
+                break
+            if not self._fd_busy[fd]:
+                del self._fds[path]
+                os.close(fd)
+
+    async def _fd_io(self, path: Path, op, *args, create: bool = False):
+        """Выполняет op(fd, *args) (os.pread/os.pwrite/...) в потоке на закэшированном fd."""
+        fd = self._get_fd(path, create)
+        self._fd_busy[fd] += 1
+        try:
+            return await asyncio.to_thread(op, fd, *args)
+        finally:
+            self._fd_busy[fd] -= 1
+            if not self._fd_busy[fd]:
+                del self._fd_busy[fd]
+            self._evict_fds()
+
     def _info_path(self, prefix: str) -> Path:
         return self.base_path / f'{prefix}.info'
 
+    def _log_path(self, prefix: str) -> Path:
+        return self.base_path / f'{prefix}.log'
+
     def _data_path(self, prefix: str, rec_id: int) -> Path:
         return self.base_path / f'{prefix}{rec_id}'
 
@@ -83,46 +220,136 @@ class ShardManager:
 
     
     async def _load_info(self, prefix: str) -> Dict:
-        path = self._info_path(prefix)
-        if not path.exists():
-            return {'shards': 0, 'free': {}, 'log': []}
+        if prefix in self._info_cache:
+            return self._info_cache[prefix]
 
-        async with aiofiles.open(path, 'r') as f:
-            try:
-                raw = await asyncio.wait_for(f.read(), IO_TIMEOUT)
-                data = json.loads(raw) if raw.strip() else {}
-            except Exception as e:
-                logger.error(f'Error reading {path}: {e}')
-                data = {}
-
-        return {
-            'shards': data.get('shards', 0),
-            'free'  : data.get('free', {}),
-            'log'   : data.get('log',  []),
+        path = self._info_path(prefix)
+        data = {}
+        if path.exists():
+            async with aiofiles.open(path, 'rb') as f:
+                try:
+                    raw = await asyncio.wait_for(f.read(), IO_TIMEOUT)
+                    data = orjson.loads(raw) if raw.strip() else {}
+                except Exception as e:
+                    logger.error('Error reading %s: %s', path, e)
+                    data = {}
+
+        info = {
+            'shards' : data.get('shards', 0),
+            'free'   : data.get('free', {}),
+            'next_id': data.get('next_id', {}),
         }
+        # .info пишется с задержкой, поэтому после рестарта сверяем счётчики
+        # с фактическими шард-файлами: на диске записей может быть больше
+        while self._data_path(prefix, info['shards']).exists():
+            info['shards'] += 1
+        for idx in range(info['shards']):
+            data_path = self._data_path(prefix, idx)
+            if data_path.exists():
+                on_disk = data_path.stat().st_size // RECORD_SIZE
+                key     = str(idx)
+                info['next_id'][key] = max(info['next_id'].get(key, 0), on_disk)
+        # свободный слот мог быть занят заново уже после последнего сброса .info —
+        # без сверки следующая вставка молча затёрла бы живую запись
+        for key, free in info['free'].items():
+            if free:
+                info['free'][key] = await asyncio.to_thread(
+                    _free_slots_sync, self._data_path(prefix, int(key)), free,
+                    info['next_id'].get(key, 0))
+        self._info_cache[prefix] = info
+        # старый формат: журнал лежал внутри .info — переносим его в .log
+        if data.get('log') and not self._log_path(prefix).exists():
+            self._log_buf[prefix] = [orjson.dumps(e) + b'\n' for e in data['log']]
+            await self._save_info(prefix, info)
+        return info
 
     
     async def _save_info(self, prefix: str, info: Dict):
+        # только помечаем prefix грязным — на диск пишет _flusher
+        self._info_cache[prefix] = info
+        self._dirty.add(prefix)
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.create_task(self._flusher())
+
+    async def _write_info(self, prefix: str, info: Dict):
         path = self._info_path(prefix)
         tmp  = path.with_suffix('.tmp')
-        async with aiofiles.open(tmp, 'w') as f:
-            await f.write(json.dumps(info, indent=2))
+        # сериализуем вне event loop; info не меняется — flush держит meta_lock
+        raw  = await asyncio.to_thread(orjson.dumps, info, option=orjson.OPT_INDENT_2)
+        async with aiofiles.open(tmp, 'wb') as f:
+            await f.write(raw)
             await f.flush()
         os.replace(tmp, path)
         os.chmod(path, 0o644)
 
+    def _log(self, prefix: str, ts: int, op: str):
+        # журнал только дописывается; на диск уходит вместе с .info в flush()
+        self._log_buf.setdefault(prefix, []).append(orjson.dumps((ts, op)) + b'\n')
+
+    async def _write_log(self, prefix: str, lines: List[bytes]):
+        self._log_count[prefix] = await asyncio.to_thread(
+            _append_log_sync, self._log_path(prefix), lines,
+            self._log_count.get(prefix))
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(INFO_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Сбрасывает на диск все изменённые .info и накопленный журнал."""
+        async with self.meta_lock:
+            prefixes, self._dirty = self._dirty, set()
+            for prefix in prefixes:
+                lines = self._log_buf.pop(prefix, None)
+                try:
+                    await self._write_info(prefix, self._info_cache[prefix])
+                    if lines:
+                        await self._write_log(prefix, lines)
+                        lines = None
+                except Exception as e:
+                    if lines:
+                        self._log_buf[prefix] = lines + self._log_buf.get(prefix, [])
+                    logger.error('Error writing info for %s: %s', prefix, e)
+                    self._dirty.add(prefix)     # попробуем в следующий раз
+
+    async def close(self):
+        """Останавливает фоновый сброс, дописывает .info, гасит пул сканирования,
+        закрывает fd и отображения шард-файлов."""
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        await self.flush()
+        self._scan_pool.shutdown(wait=False)
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        with self._mmap_lock:
+            mmaps, self._mmaps = list(self._mmaps.values()), {}
+        for mm in mmaps:
+            try:
+                mm.close()
+            except BufferError:
+                pass    # ещё идущий скан держит буфер — освободится вместе с ним
+
 
     async def add_record(self, username: str, password_hash: str,
                          ip_reg: str, last_logged: str, last_ip: str) -> str:
         if not username or not username[0].isalpha():
             raise ValueError('Username must start with a letter')
 
+        # режем по байтовой ширине поля (как ляжет на диск), а не по символам —
+        # иначе кэш и файл разойдутся на многобайтовых символах
         cleaned = {
-            'username'     : self._clean_field(username)[:MAX_LENGTHS['username']],
-            'password_hash': self._clean_field(password_hash)[:MAX_LENGTHS['password_hash']],
-            'ip_reg'       : self._clean_field(ip_reg)[:MAX_LENGTHS['ip_reg']],
-            'last_logged'  : self._clean_field(last_logged)[:MAX_LENGTHS['last_logged']],
-            'last_ip'      : self._clean_field(last_ip)[:MAX_LENGTHS['last_ip']],
+            'username'     : fit_field(self._clean_field(username), MAX_LENGTHS['username']),
+            'password_hash': fit_field(self._clean_field(password_hash), MAX_LENGTHS['password_hash']),
+            'ip_reg'       : fit_field(self._clean_field(ip_reg), MAX_LENGTHS['ip_reg']),
+            'last_logged'  : fit_field(self._clean_field(last_logged), MAX_LENGTHS['last_logged']),
+            'last_ip'      : fit_field(self._clean_field(last_ip), MAX_LENGTHS['last_ip']),
         }
 
         prefix = self._sanitize_shard_prefix(cleaned['username'])
@@ -134,169 +361,178 @@ class ShardManager:
             data_path = self._data_path(prefix, shard_idx)
             free_list = info['free'].setdefault(str(shard_idx), [])
 
-            # берем свободный слот либо идём в конец
+            # берем свободный слот либо следующий по счётчику — без похода к файлу
+            grows = not free_list
             if free_list:
                 rec_id = free_list.pop(0)
             else:
-                if data_path.exists():
-                    async with aiofiles.open(data_path, 'rb') as f:
-                        await f.seek(0, os.SEEK_END)
-                        rec_id = await f.tell() // RECORD_SIZE
-                else:
-                    rec_id = 0
+                rec_id = info['next_id'].get(str(shard_idx), 0)
 
             # если лимит переполнен — новый шард
             if rec_id >= RECORD_LIMIT:
                 shard_idx += 1
                 info['shards'] = shard_idx + 1
+                data_path = self._data_path(prefix, shard_idx)
                 rec_id = 0
             elif info['shards'] == 0:
                 info['shards'] = 1
 
             # формируем запись
             values = [str(rec_id), *[cleaned[f] for f in FIELDS if f != 'id']]
-            blob   = FIELD_SEPARATOR.join(
-                        v.ljust(MAX_LENGTHS[k]).encode()
-                        for k, v in zip(FIELDS, values))
+            iov    = encode_record(values)
 
-            # пишем
-            async with aiofiles.open(
-                    data_path, 'r+b' if data_path.exists() else 'wb') as f:
-                await f.seek(rec_id * RECORD_SIZE)
-                await f.write(blob)
-                await f.flush()
+            # пишем одним pwritev, без склейки полей в промежуточный блоб
+            await self._fd_io(data_path, os.pwritev, iov, rec_id * RECORD_SIZE,
+                              create=True)
+            if grows:
+                info['next_id'][str(shard_idx)] = rec_id + 1
+                self._drop_mmap(data_path)   # файл вырос — старое отображение короче
 
             ref = f'{prefix}{shard_idx}:{rec_id}'
-            info['log'].append((now, f'CREATE {ref}'))
-            info['log'] = info['log'][-LOG_LIMIT:]
+            self._log(prefix, now, f'CREATE {ref}')
             await self._save_info(prefix, info)
 
         # кэш
-        async with self.cache_lock:
-            self.cache[ref] = Record(fields=dict(zip(FIELDS, values)),
-                                     timestamp=now)
+        self._cache_put(ref, Record(values=tuple(values), timestamp=now))
         return ref
 
 
     async def get_record(self, ref: str,
                          fields: Optional[List[str]] = None) -> Optional[Dict[str, str]]:
-        async with self.cache_lock:
-            if ref in self.cache:
-                rec = self.cache[ref]
-                return {k: rec.fields[k] for k in (fields or FIELDS)}
+        rec = self._cache_get(ref)
+        if rec is not None:
+            return {k: rec.values[FIELD_INDEX[k]] for k in (fields or FIELDS)}
 
         try:
-            shard, rec_id = self._validate_ref(ref)
-            prefix, idx   = shard[:-1], int(shard[-1])
+            prefix, idx, rec_id = self._validate_ref(ref)
         except ValueError:
             return None
 
         path = self._data_path(prefix, idx)
-        if not path.exists():
+        try:
+            raw = await self._fd_io(path, os.pread, RECORD_SIZE, rec_id * RECORD_SIZE)
+        except FileNotFoundError:
             return None
-
-        async with aiofiles.open(path, 'rb') as f:
-            await f.seek(rec_id * RECORD_SIZE)
-            raw = await f.read(RECORD_SIZE)
-        if len(raw) != RECORD_SIZE:
+        # короткое чтение или удалённая (обнулённая) запись
+        if len(raw) != RECORD_SIZE or raw[0] == 0:
             return None
 
-        parts  = raw.split(FIELD_SEPARATOR)
-        values = [p.decode().strip() for p in parts]
-        record = dict(zip(FIELDS, values))
+        if fields:
+            # узкий GET: декодируем только нужные поля, в кэш не кладём
+            return dict(zip(fields, decode_record(raw, fields)))
 
-        async with self.cache_lock:
-            self.cache[ref] = Record(fields=record, timestamp=int(time.time()))
-        return {k: record[k] for k in (fields or FIELDS)}
+        values = tuple(decode_record(raw))
+        self._cache_put(ref, Record(values=values, timestamp=int(time.time())))
+        return dict(zip(FIELDS, values))
 
-    async def delete_record(self, ref: str) -> bool:
+    async def _slot_exists(self, ref: str, path: Path, rec_id: int) -> bool:
+        """Есть ли живая запись в слоте: по кэшу, иначе по первому байту на диске."""
+        if ref in self.cache:
+            return True
+        return await self._slot_on_disk(path, rec_id)
+
+    async def _slot_on_disk(self, path: Path, rec_id: int) -> bool:
+        # удалённая запись обнулена, за концом файла pread вернёт пусто
         try:
-            shard, rec_id = self._validate_ref(ref)
-            prefix, idx   = shard[:-1], int(shard[-1])
-        except ValueError:
+            head = await self._fd_io(path, os.pread, 1, rec_id * RECORD_SIZE)
+        except FileNotFoundError:
             return False
+        return head not in (b'', b'\x00')
 
-        if not await self.get_record(ref):      # проверяем существование
+    async def delete_record(self, ref: str) -> bool:
+        try:
+            prefix, idx, rec_id = self._validate_ref(ref)
+        except ValueError:
             return False
 
         now  = int(time.time())
         path = self._data_path(prefix, idx)
 
         async with self.meta_lock, self.data_lock:
-            try:
-                async with aiofiles.open(path, 'r+b') as f:
-                    await f.seek(rec_id * RECORD_SIZE)
-                    await f.write(b'\x00' * RECORD_SIZE)
-                    await f.flush()
-            except FileNotFoundError:
+            # проверяем существование под локом и всегда по диску (не по кэшу),
+            # чтобы слот не освободили дважды
+            if not await self._slot_on_disk(path, rec_id):
                 return False
+            await self._fd_io(path, os.pwrite, b'\x00' * RECORD_SIZE,
+                              rec_id * RECORD_SIZE)
 
             info = await self._load_info(prefix)
             info['free'].setdefault(str(idx), []).append(rec_id)
-            info['log'].append((now, f'DELETE {ref}'))
-            info['log'] = info['log'][-LOG_LIMIT:]
+            self._log(prefix, now, f'DELETE {ref}')
             await self._save_info(prefix, info)
 
-        async with self.cache_lock:
-            self.cache.pop(ref, None)
+        self.cache.pop(ref, None)
         return True
 
     async def update_record(self, ref: str, updates: Dict[str, str]) -> bool:
-        orig = await self.get_record(ref)
-        if not orig:
+        try:
+            prefix, idx, rec_id = self._validate_ref(ref)
+        except ValueError:
             return False
 
-        cleaned = {k: self._clean_field(v)[:MAX_LENGTHS[k]]
+        cleaned = {k: fit_field(self._clean_field(v), MAX_LENGTHS[k])
                    for k, v in updates.items()
                    if k in MAX_LENGTHS and k != 'id'}
 
-        if not cleaned:
-            return True
-
-        shard, rec_id = self._validate_ref(ref)
-        prefix, idx   = shard[:-1], int(shard[-1])
-        path          = self._data_path(prefix, idx)
+        path   = self._data_path(prefix, idx)
+        offset = rec_id * RECORD_SIZE
+        # смещения полей фиксированы — пишем только изменённые поля, без чтения записи
+        chunks = [(offset + FIELD_OFFSETS[k], v.encode().ljust(MAX_LENGTHS[k]))
+                  for k, v in cleaned.items()]
 
         async with self.data_lock:
-            # читаем текущую запись
-            async with aiofiles.open(path, 'r+b') as f:
-                await f.seek(rec_id * RECORD_SIZE)
-                raw = await f.read(RECORD_SIZE)
-                pats = raw.split(FIELD_SEPARATOR)
-            fields_now = {k: pats[i].decode().rstrip()
-                          for i, k in enumerate(FIELDS)}
-            fields_now.update(cleaned)
-            fields_now['id'] = str(rec_id)
-
-            blob = FIELD_SEPARATOR.join(
-                       fields_now[k].ljust(MAX_LENGTHS[k]).encode()
-                       for k in FIELDS)
-
-            async with aiofiles.open(path, 'r+b') as f:
-                await f.seek(rec_id * RECORD_SIZE)
-                await f.write(blob)
-                await f.flush()
-
-        async with self.cache_lock:
-            self.cache.pop(ref, None)   # проще удалить, чем аккуратно патчить
+            if not await self._slot_exists(ref, path, rec_id):
+                return False
+            if chunks:
+                await self._fd_io(path, _pwrite_chunks, chunks)
+
+        rec = self.cache.get(ref)
+        if rec is not None:
+            # патчим закэшированную запись вместо того, чтобы её выбрасывать
+            values = list(rec.values)
+            for k, v in cleaned.items():
+                values[FIELD_INDEX[k]] = v
+            self.cache[ref] = rec._replace(values=tuple(values))
         return True
 
 
     # ────────── mmap-поиск
+    def _get_mmap(self, path: Path) -> mmap.mmap:
+        """Возвращает закэшированное отображение файла, открывая его при первом обращении."""
+        mm = self._mmaps.get(path)
+        if mm is not None:
+            return mm
+        gen = self._mmap_gen[path]
+        # open()/mmap() — вне лока: его берёт и event loop (_drop_mmap), ждать диск он не должен
+        with path.open('rb') as f:
+            new = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._mmap_lock:
+            if self._mmap_gen[path] != gen:
+                return new      # файл вырос, пока отображали — в кэш не кладём
+            # параллельный скан мог успеть первым — берём уже опубликованное отображение
+            return self._mmaps.setdefault(path, new)
+
+    def _drop_mmap(self, path: Path):
+        # не закрываем явно: параллельный скан может ещё держать ссылку,
+        # отображение освободится само вместе с последней ссылкой
+        with self._mmap_lock:
+            self._mmaps.pop(path, None)
+            self._mmap_gen[path] += 1
+
     def _scan_file_sync(self, path: Path, field: str, value: str) -> List[str]:
         """Синхронно сканирует один файл и возвращает список ref-ов."""
-        refs   = []
-        offset = FIELD_OFFSETS[field]
         length = MAX_LENGTHS[field]
         prefix_shard = path.name         # например  d0
-        with path.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-            total = mm.size() // RECORD_SIZE
-            for rec_id in range(total):
-                pos = rec_id * RECORD_SIZE + offset
-                chunk = mm[pos: pos + length].rstrip()
-                if chunk.decode() == value:
-                    refs.append(f'{prefix_shard}:{rec_id}')
-        return refs
+        # значение кодируем один раз и дополняем пробелами, как оно лежит на диске
+        needle = value.encode().ljust(length)
+        if len(needle) != length:
+            return []
+        mm    = self._get_mmap(path)
+        total = len(mm) // RECORD_SIZE
+        # векторное сравнение поля по всем записям вместо цикла по rec_id
+        arr   = np.frombuffer(mm, dtype=RECORD_DTYPE, count=total)
+        hits  = np.flatnonzero(arr[field] == needle).tolist()
+        return [f'{prefix_shard}:{rec_id}' for rec_id in hits]
 
 
     async def find_records(self, field: str, value: str,
@@ -304,20 +540,18 @@ class ShardManager:
         if field not in FIELDS:
             raise ValueError(f'Invalid field: {field}')
 
-        # собираем все файлы-шарды — это всё, что НЕ заканчивается на .info
+        # собираем все файлы-шарды — это файлы без расширения (не .info/.tmp)
         shard_paths = [p for p in self.base_path.iterdir()
-                       if p.is_file() and not p.name.endswith('.info')]
+                       if p.is_file() and not p.suffix]
 
         # параллельно сканируем
-        tasks = [asyncio.to_thread(self._scan_file_sync, p, field, value)
+        loop  = asyncio.get_running_loop()
+        tasks = [loop.run_in_executor(self._scan_pool,
+                                      self._scan_file_sync, p, field, value)
                  for p in shard_paths]
         refs_nested = await asyncio.gather(*tasks)
         refs = [r for sub in refs_nested for r in sub]
 
-        # получаем записи (можно параллельно, но чаще нужно ≤ десятка)
-        records = []
-        for ref in refs:
-            rec = await self.get_record(ref, fields)
-            if rec is not None:
-                records.append({'ref': ref, **rec})
-        return records
+        # получаем записи параллельно: чтения независимы и идут в разные потоки
+        recs = await asyncio.gather(*(self.get_record(r, fields) for r in refs))
+        return [{'ref': ref, **rec} for ref, rec in zip(refs, recs) if rec is not None]
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+
+from shard import ShardManager
+
+
+@pytest.mark.parametrize('ref', ['a0:0', 'q12:4999', 'ж3:7'])
+def test_validate_ref_accepts_shard_refs(ref):
+    prefix, idx, rec_id = ShardManager._validate_ref(ref)
+    assert f'{prefix}{idx}:{rec_id}' == ref
+
+
+@pytest.mark.parametrize('ref', ['../victim7:0', '/tmp/x0:0', 'ab0:0', 'A0:0',
+                                 '0:0', '.0:0', 'a-1:0', 'a0:-1', 'a0', 'a0:0:0',
+                                 'a0:00', 'a00:0', 'a0:+0', 'a0: 0', 'a0:0_0'])
+def test_validate_ref_rejects_foreign_prefixes(ref):
+    with pytest.raises(ValueError):
+        ShardManager._validate_ref(ref)
+
+
+def test_ref_cannot_escape_base_path(tmp_path):
+    victim = tmp_path / 'victim7'
+    victim.write_bytes(b'keep')
+
+    async def scenario():
+        mgr = ShardManager(base_path=str(tmp_path / 'shards'))
+        try:
+            assert not await mgr.update_record('../victim7:0', {'username': 'pwned'})
+            assert not await mgr.delete_record('../victim7:0')
+        finally:
+            await mgr.close()
+
+    asyncio.run(scenario())
+    assert victim.read_bytes() == b'keep'
+
+
+def test_reused_free_slot_survives_lost_info_flush(tmp_path):
+    base = str(tmp_path / 'shards')
+    row  = ('hash', '127.0.0.1', '2025-06-16T12:00:00', '127.0.0.1')
+
+    async def scenario():
+        mgr = ShardManager(base_path=base)
+        ref = await mgr.add_record('alex', *row)
+        await mgr.delete_record(ref)
+        await mgr.flush()                       # на диске free = [0]
+        assert await mgr.add_record('anna', *row) == ref
+        mgr._flusher_task.cancel()              # «падение» до следующего сброса .info
+
+        mgr = ShardManager(base_path=base)
+        try:
+            assert await mgr.add_record('adam', *row) != ref
+            assert (await mgr.get_record(ref))['username'] == 'anna'
+        finally:
+            await mgr.close()
+
+    asyncio.run(scenario())
+
+
+def test_multibyte_values_are_cut_on_character_boundary(tmp_path):
+    row = ('hash', '127.0.0.1', '2025-06-16T12:00:00', '127.0.0.1')
+
+    async def scenario():
+        mgr = ShardManager(base_path=str(tmp_path / 'shards'))
+        try:
+            ref = await mgr.add_record('b' + 'ж' * 20, *row)
+            assert await mgr.update_record(ref, {'ip_reg': 'x' + 'ж' * 10})
+            cached = await mgr.get_record(ref)
+            mgr.cache.clear()
+            on_disk = await mgr.get_record(ref)
+            assert cached == on_disk
+            assert on_disk['username'] == 'b' + 'ж' * 11
+            assert on_disk['ip_reg'] == 'x' + 'ж' * 7
+            found = await mgr.find_records('id', '0')
+            assert found[0]['username'] == on_disk['username']
+        finally:
+            await mgr.close()
+
+    asyncio.run(scenario())
+
+
+def test_ref_aliases_cannot_free_a_slot_twice(tmp_path):
+    row = ('hash', '127.0.0.1', '2025-06-16T12:00:00', '127.0.0.1')
+
+    async def scenario():
+        mgr = ShardManager(base_path=str(tmp_path / 'shards'))
+        try:
+            ref = await mgr.add_record('alice', *row)
+            assert await mgr.get_record(ref + '0') is None
+            assert await mgr.delete_record(ref)
+            assert not await mgr.delete_record(ref + '0')
+            assert not await mgr.delete_record(ref)
+            first  = await mgr.add_record('anna', *row)
+            second = await mgr.add_record('adam', *row)
+            assert first != second
+            assert (await mgr.get_record(first))['username'] == 'anna'
+        finally:
+            await mgr.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('username', ['İstanbul', 'Жанна', 'Ωmega', 'bob'])
+def test_created_refs_are_accepted_back(tmp_path, username):
+    row = ('hash', '127.0.0.1', '2025-06-16T12:00:00', '127.0.0.1')
+
+    async def scenario():
+        mgr = ShardManager(base_path=str(tmp_path / 'shards'))
+        try:
+            ref = await mgr.add_record(username, *row)
+            mgr.cache.clear()
+            assert (await mgr.get_record(ref))['username'] == username
+            assert await mgr.update_record(ref, {'last_ip': '10.0.0.1'})
+            assert await mgr.delete_record(ref)
+        finally:
+            await mgr.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_releases_scan_mmaps(tmp_path):
+    row = ('hash', '127.0.0.1', '2025-06-16T12:00:00', '127.0.0.1')
+
+    async def scenario():
+        mgr = ShardManager(base_path=str(tmp_path / 'shards'))
+        await mgr.add_record('alice', *row)
+        assert len(await mgr.find_records('username', 'alice')) == 1
+        mmaps = list(mgr._mmaps.values())
+        assert mmaps
+        await mgr.close()
+        assert not mgr._mmaps
+        assert all(mm.closed for mm in mmaps)
+
+    asyncio.run(scenario())
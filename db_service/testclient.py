@@ -1,76 +1,53 @@
 import asyncio
-import json
 import os
+import msgspec
+
+from protocol import (CreateReq, GetReq, DeleteReq, UpdateReq, FindReq, Reply,
+                      frame, read_frame)
 
 # Path to UNIX-socket
 SOCKET_PATH = os.getenv("USER_DB_PATH", "/tmp/user_db.sock")
 
 
+async def request(reader, writer, req) -> Reply:
+    print(f"> {req}")
+    writer.write(frame(msgspec.msgpack.encode(req)))
+    await writer.drain()
+    reply = msgspec.msgpack.decode(await read_frame(reader), type=Reply)
+    print(f"< {reply}")
+    return reply
+
+
 async def run_tests():
     reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
 
     # 1) CREATE
-    cmd = "CREATE alice secret_hash 127.0.0.1 2025-06-16T12:00:00 127.0.0.1"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    text = resp.decode().strip()
-    print("< " + text)
-    if not text.startswith("OK "):
+    reply = await request(reader, writer, CreateReq(
+        "alice", "secret_hash", "127.0.0.1", "2025-06-16T12:00:00", "127.0.0.1"))
+    if not reply.ok:
         print("CREATE failed, aborting")
         writer.close()
         await writer.wait_closed()
         return
-    ref = text.split(" ", 1)[1]
+    ref = reply.result
 
     # 2) GET
-    cmd = f"GET {ref}"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    await request(reader, writer, GetReq(ref))
 
     # 3) UPDATE
-    cmd = f"UPDATE {ref} last_ip=192.168.0.2"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    await request(reader, writer, UpdateReq(ref, {"last_ip": "192.168.0.2"}))
 
-    # 4) GET before UPDATE (only last_ip)
-    cmd = f"GET {ref} last_ip"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    # 4) GET after UPDATE (only last_ip)
+    await request(reader, writer, GetReq(ref, ["last_ip"]))
 
     # 5) FIND by username
-    cmd = "FIND username alice"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    await request(reader, writer, FindReq("username", "alice"))
 
     # 6) DELETE
-    cmd = f"DELETE {ref}"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    await request(reader, writer, DeleteReq(ref))
 
-    # 7) GET before DELETE
-    cmd = f"GET {ref}"
-    print("> " + cmd)
-    writer.write((cmd + "\\n").encode())
-    await writer.drain()
-    resp = await reader.readline()
-    print("< " + resp.decode().strip())
+    # 7) GET after DELETE
+    await request(reader, writer, GetReq(ref))
 
     writer.close()
     await writer.wait_closed()
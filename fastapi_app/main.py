@@ -1,9 +1,15 @@
 import os
+import hmac
 import asyncio
-import json
-from fastapi import FastAPI, HTTPException, Depends, status, Query, Path
+import struct
+import msgspec
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, Literal
+from fastapi import FastAPI, HTTPException, Depends, Request, status, Query, Path
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from pydantic import BaseModel
 
 # --- Configs from envs ---
 ADMIN_LOGIN = os.getenv("ADMIN_LOGIN")
@@ -13,15 +19,29 @@ SOCKET_PATH = os.getenv("USER_DB_PATH", "/tmp/user_db.sock")
 if not ADMIN_LOGIN or not ADMIN_PASSWORD:
     raise RuntimeError("Необходимо задать ADMIN_LOGIN и ADMIN_PASSWORD в окружении")
 
+# encoded once: compare_digest works on bytes, no re-encoding per request
+ADMIN_LOGIN_B = ADMIN_LOGIN.encode()
+ADMIN_PASSWORD_B = ADMIN_PASSWORD.encode()
+
 # --- FastAPI + BasicAuth ---
-app = FastAPI(title="UserDB Proxy API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one socket connection per worker, owned by a background task
+    task = asyncio.create_task(connection_loop())
+    yield
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan, title="UserDB Proxy API", default_response_class=ORJSONResponse)
 security = HTTPBasic()
 
 
 def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
-    correct_user = credentials.username == ADMIN_LOGIN
-    correct_pass = credentials.password == ADMIN_PASSWORD
-    if not (correct_user and correct_pass):
+    # constant-time compare; `&` instead of `and` so both checks always run
+    correct_user = hmac.compare_digest(credentials.username.encode(), ADMIN_LOGIN_B)
+    correct_pass = hmac.compare_digest(credentials.password.encode(), ADMIN_PASSWORD_B)
+    if not (correct_user & correct_pass):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -29,8 +49,8 @@ def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
         )
 
 
-# --- Pydantic-models ---
-class CreateRequest(BaseModel):
+# --- Request bodies (msgspec instead of pydantic: decoded straight from JSON in C) ---
+class CreateRequest(msgspec.Struct):
     username: str
     password_hash: str
     ip_reg: str
@@ -38,7 +58,7 @@ class CreateRequest(BaseModel):
     last_ip: str
 
 
-class UpdateRequest(BaseModel):
+class UpdateRequest(msgspec.Struct):
     # any of the fields except id
     username: str | None = None
     password_hash: str | None = None
@@ -47,37 +67,168 @@ class UpdateRequest(BaseModel):
     last_ip: str | None = None
 
 
-# --- Helper function for communicating with a UNIX socket ---
-async def send_cmd(cmd: str) -> str:
+CREATE_DECODER = msgspec.json.Decoder(CreateRequest)
+UPDATE_DECODER = msgspec.json.Decoder(UpdateRequest)
+
+
+def decode_body(decoder: msgspec.json.Decoder, raw: bytes) -> Any:
     try:
-        reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="Socket server is not running")
-    # we send a command
-    writer.write((cmd + "\n").encode())
-    await writer.drain()
-    # read the answer
-    raw = await reader.readline()
-    writer.close()
-    await writer.wait_closed()
-    if not raw:
-        raise HTTPException(status_code=500, detail="No response from server")
-    text = raw.decode().strip()
-    if text.startswith("OK "):
-        return text[3:]
-    elif text == "OK Deleted" or text == "OK Updated":
-        return text[3:]  # just "Deleted"/"Updated"
-    else:
-        # ERROR ...
-        raise HTTPException(status_code=400, detail=text)
+        return decoder.decode(raw)
+    except msgspec.DecodeError as e:  # ValidationError included
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def body_schema(model: type) -> dict:
+    """OpenAPI requestBody for a msgspec struct, so Swagger UI still shows the body."""
+    (_,), components = msgspec.json.schema_components([model])
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": components[model.__name__]}}}}
+
+
+# --- UNIX socket protocol (mirrors db_service/protocol.py) ---
+# every message is a frame: 4-byte big-endian length + msgpack body;
+# structs travel as arrays ([tag, args in order]), not maps keyed by field name
+HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # a bogus length must not make readexactly() buffer gigabytes
+MAX_REQUEST_SIZE = 64 * 1024  # same limit as db_service/server.py, checked before queueing
+
+
+class CreateReq(msgspec.Struct, tag="CREATE", array_like=True):
+    username: str
+    password_hash: str
+    ip_reg: str
+    last_logged: str
+    last_ip: str
+
+
+class GetReq(msgspec.Struct, tag="GET", array_like=True):
+    ref: str
+    fields: tuple[str, ...] | None = None
+
+
+class DeleteReq(msgspec.Struct, tag="DELETE", array_like=True):
+    ref: str
+
+
+UpdatableField = Literal["username", "password_hash", "ip_reg", "last_logged", "last_ip"]
+
+
+class UpdateReq(msgspec.Struct, tag="UPDATE", array_like=True):
+    ref: str
+    fields: dict[UpdatableField, str]
+
+
+class FindReq(msgspec.Struct, tag="FIND", array_like=True):
+    field: str
+    value: str
+    fields: tuple[str, ...] | None = None
+
+
+class Reply(msgspec.Struct, omit_defaults=True, array_like=True):
+    ok: bool
+    result: Any = None
+    error: str | None = None
+
+
+# one encoder/decoder per process instead of per-call setup
+ENCODER = msgspec.msgpack.Encoder()
+REPLY_DECODER = msgspec.msgpack.Decoder(Reply)
+
+
+# --- Single multiplexed connection to the UNIX socket server ---
+# The server answers strictly in request order, so a FIFO of futures is enough
+# to match replies to callers; requests are pipelined without waiting for replies.
+_requests: asyncio.Queue = asyncio.Queue()  # (payload, future) not yet sent
+
+
+def fail(fut: asyncio.Future, detail: str):
+    if not fut.done():  # the caller may already be gone (client disconnected)
+        fut.set_exception(HTTPException(status_code=500, detail=detail))
+
+
+async def send_loop(writer: asyncio.StreamWriter, inflight: deque, first: tuple):
+    payload, fut = first
+    while True:
+        if not fut.done():
+            inflight.append(fut)
+            writer.writelines((HEADER.pack(len(payload)), payload))
+            # drain() returns only once the request is fully handed to the socket (real backpressure)
+            await writer.drain()
+        payload, fut = await _requests.get()
+
+
+async def receive_loop(reader: asyncio.StreamReader, inflight: deque):
+    while True:
+        (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+        if size > MAX_FRAME_SIZE:
+            # the header is valid: skip the body in chunks, fail only this request
+            fail(inflight.popleft(), "Reply too large")
+            while size:
+                n = min(size, 64 * 1024)
+                await reader.readexactly(n)
+                size -= n
+            continue
+        raw = await reader.readexactly(size)
+        fut = inflight.popleft()
+        if not fut.done():
+            fut.set_result(raw)
+
+
+async def connection_loop():
+    """Owns the socket: (re)connects on demand, pumps requests out and replies back."""
+    while True:
+        first = await _requests.get()  # connect lazily, on the first request
+        try:
+            reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
+        except OSError:
+            fail(first[1], "Socket server is not running")
+            continue
+        writer.transport.set_write_buffer_limits(high=0)
+
+        inflight: deque = deque()  # futures of sent requests, in send order
+        tasks = [asyncio.create_task(send_loop(writer, inflight, first)),
+                 asyncio.create_task(receive_loop(reader, inflight))]
+        try:
+            # either side stops only when the connection breaks (e.g. server restart)
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            # the connection is broken or being dropped: no graceful FIN handshake to wait for
+            writer.transport.abort()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            while inflight:
+                fail(inflight.popleft(), "No response from server")
+
+
+# --- Helper function for communicating with a UNIX socket ---
+async def send_cmd(req: msgspec.Struct) -> Any:
+    payload = ENCODER.encode(req)
+    if len(payload) > MAX_REQUEST_SIZE:
+        # the server would refuse it anyway; don't put it on the shared connection
+        raise HTTPException(status_code=413, detail="Request too large")
+    fut = asyncio.get_running_loop().create_future()
+    _requests.put_nowait((payload, fut))
+    raw = await fut
+    reply = REPLY_DECODER.decode(raw)
+    if not reply.ok:
+        raise HTTPException(status_code=400, detail=f"ERROR {reply.error}")
+    return reply.result
+
+
+@lru_cache(maxsize=1024)
+def parse_fields(fields: str) -> tuple[str, ...]:
+    # clients ask for a small set of field combinations, so each is split only once
+    return tuple(fields.split(","))
 
 
 # --- endpoints ---
 
-@app.post("/records", dependencies=[Depends(verify_credentials)])
-async def create_record(req: CreateRequest):
-    cmd = f"CREATE {req.username} {req.password_hash} {req.ip_reg} {req.last_logged} {req.last_ip}"
-    res = await send_cmd(cmd)
+@app.post("/records", dependencies=[Depends(verify_credentials)],
+          openapi_extra=body_schema(CreateRequest))
+async def create_record(request: Request):
+    req = decode_body(CREATE_DECODER, await request.body())
+    res = await send_cmd(CreateReq(*msgspec.structs.astuple(req)))
     # res == "<ref>"
     return {"ref": res}
 
@@ -90,35 +241,28 @@ async def get_record(
             description="Comma-separated list of fields to return, e.g. username,last_ip"
         )
 ):
-    if fields:
-        cmd = f"GET {ref} {fields}"
-    else:
-        cmd = f"GET {ref}"
-    res = await send_cmd(cmd)
-    # res == JSON-string with object
-    return json.loads(res)
+    res = await send_cmd(GetReq(ref, parse_fields(fields) if fields else None))
+    # res == record object
+    return res
 
 
-@app.put("/records/{ref}", dependencies=[Depends(verify_credentials)])
+@app.put("/records/{ref}", dependencies=[Depends(verify_credentials)],
+         openapi_extra=body_schema(UpdateRequest))
 async def update_record(
-        ref: str = Path(..., description="Reference, e.g. a0:3"),
-        req: UpdateRequest = Depends()
+        request: Request,
+        ref: str = Path(..., description="Reference, e.g. a0:3")
 ):
-    pairs = []
-    for k, v in req.dict().items():
-        if v is not None:
-            pairs.append(f"{k}={v}")
-    if not pairs:
+    req = decode_body(UPDATE_DECODER, await request.body())
+    upd = {k: v for k, v in msgspec.structs.asdict(req).items() if v is not None}
+    if not upd:
         raise HTTPException(status_code=400, detail="No fields to update")
-    cmd = f"UPDATE {ref} " + " ".join(pairs)
-    res = await send_cmd(cmd)  # "Updated"
+    res = await send_cmd(UpdateReq(ref, upd))  # "Updated"
     return {"status": res}
 
 
 @app.delete("/records/{ref}", dependencies=[Depends(verify_credentials)])
 async def delete_record(ref: str = Path(..., description="Reference, e.g. a0:3")):
-    cmd = f"DELETE {ref}"
-    res = await send_cmd(cmd)  # "Deleted"
+    res = await send_cmd(DeleteReq(ref))  # "Deleted"
     return {"status": res}
 
 
@@ -131,10 +275,6 @@ async def find_records(
             description="Комма-сепарейтед список полей для вывода"
         )
 ):
-    if fields:
-        cmd = f"FIND {field} {value} {fields}"
-    else:
-        cmd = f"FIND {field} {value}"
-    res = await send_cmd(cmd)
-    # res == JSON string with list of records
-    return json.loads(res)
+    res = await send_cmd(FindReq(field, value, parse_fields(fields) if fields else None))
+    # res == list of records
+    return res